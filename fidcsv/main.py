@@ -1,18 +1,73 @@
 #!/usr/bin/env python3
 
+import csv
+import functools
+import hashlib
+import importlib.metadata
+import math
 import os
-import shutil
+import pickle
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from operator import attrgetter
 from pathlib import Path
 from box import Box
+import numpy as np
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from charapi import evaluate_charity
 
-def compute_ein_aggregates(df, ein, aggregate_config):
-    """Compute aggregates from input CSV based on configuration.
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+CONFIG_PATH = Path(__file__).parent / "config" / "config.yaml"
+
+_SESSION = None
+_AGGREGATIONS = ("sum", "count", "max", "first")
+_DATA_CLEANS = ("currency", "none")
+_FLUSH_INTERVAL = 100
+_PROGRESS_INTERVAL = 50
+_EVAL_MEMO_SIZE = 32
+_WARNED_BAD_CACHE = False
+
+def install_shared_session(pool_size):
+    """Route requests.get/post through one pooled, retrying Session.
+
+    charapi does not accept a session, so its module-level requests calls are
+    redirected here to reuse connections instead of opening one per EIN.
+    """
+    global _SESSION
+    if _SESSION is not None:
+        return _SESSION
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=3, backoff_factor=0.2),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    requests.get = session.get
+    requests.post = session.post
+    _SESSION = session
+    return session
+
+@functools.lru_cache(maxsize=1)
+def load_config(path=str(CONFIG_PATH)):
+    """Parse config.yaml once per process with ruamel's safe (libyaml-backed) loader."""
+    return Box.from_yaml(filename=path, ruamel_typ="safe")
+
+def build_aggregate_plan(aggregate_config):
+    """Flatten the included input aggregates into plain tuples, once per run.
 
     Args:
-        df: Input DataFrame
-        ein: Employer Identification Number to aggregate
         aggregate_config: Config dict mapping field names to config dicts with:
                          - include: bool
                          - csv_field: str (column name in df)
@@ -20,95 +75,337 @@ def compute_ein_aggregates(df, ein, aggregate_config):
                          - data_clean: str ('currency' or 'none')
 
     Returns:
-        Dict of field_name -> aggregated value for included fields
+        Tuple of (field_name, csv_field, aggregation, data_clean) tuples for included fields
+
+    Raises:
+        ValueError: If an included field names an unknown aggregation or data_clean
+    """
+    plan = tuple(
+        (field_name, field_config["csv_field"], field_config["aggregation"], field_config.get("data_clean", "none"))
+        for field_name, field_config in aggregate_config.items()
+        if field_config.get("include", False)
+    )
+    for field_name, _, aggregation, data_clean in plan:
+        if aggregation not in _AGGREGATIONS:
+            raise ValueError(f"input_aggregates.{field_name}: unknown aggregation '{aggregation}'")
+        if data_clean not in _DATA_CLEANS:
+            raise ValueError(f"input_aggregates.{field_name}: unknown data_clean '{data_clean}'")
+    return plan
+
+def load_input(data_path, aggregate_plan):
+    """Read the input CSV, keeping only Tax ID and the columns aggregates refer to.
+
+    Tax ID is parsed as a category so grouping compares integer codes, and
+    currency columns are kept as strings for clean_currency_columns. Parsing
+    uses pyarrow's multithreaded reader when pyarrow is installed; column types
+    are fixed up front there so EINs such as 012345678 keep their leading zero.
     """
-    result = {}
-    ein_data = df[df["Tax ID"] == ein]
+    wanted = {"Tax ID"} | {csv_field for _, csv_field, _, _ in aggregate_plan}
+    usecols = [col for col in pd.read_csv(data_path, nrows=0).columns if col in wanted]
+    currency_fields = {csv_field for _, csv_field, _, data_clean in aggregate_plan if data_clean == "currency"}
+
+    if pa_csv is not None:
+        string_fields = ({"Tax ID"} | currency_fields) & set(usecols)
+        convert_options = pa_csv.ConvertOptions(
+            column_types={csv_field: pa.string() for csv_field in string_fields},
+            include_columns=usecols,
+            strings_can_be_null=True,
+        )
+        df = pa_csv.read_csv(data_path, convert_options=convert_options).to_pandas()
+        df["Tax ID"] = df["Tax ID"].astype("category")
+        return df
+
+    dtype = {"Tax ID": "category"} | {csv_field: "string" for csv_field in currency_fields - {"Tax ID"}}
+    return pd.read_csv(data_path, usecols=usecols, dtype=dtype, engine="c")
+
+def clean_currency_columns(df, aggregate_plan):
+    """Convert every currency column referenced by the aggregates to float, in place.
+
+    Each column is cleaned once, however many aggregate fields refer to it.
+    Values that are not numbers once $ and commas are removed become NaN.
+    """
+    currency_fields = {csv_field for _, csv_field, _, data_clean in aggregate_plan if data_clean == "currency"}
+    for csv_field in currency_fields:
+        if csv_field in df.columns and not pd.api.types.is_numeric_dtype(df[csv_field]):
+            stripped = df[csv_field].str.replace("$", "", regex=False).str.replace(",", "", regex=False)
+            df[csv_field] = pd.to_numeric(stripped, errors="coerce").astype("float64")
+    return df
 
-    if ein_data.empty:
-        return result
+def _group_sum_max(codes, values, n_groups):
+    """NaN-skipping per-group sum and max of each column of a 2-D float array.
 
-    for field_name, field_config in aggregate_config.items():
-        if not field_config.get("include", False):
-            continue
+    Args:
+        codes: Group number (0..n_groups-1) of each row
+        values: float64 array of shape (rows, columns)
+        n_groups: Number of groups
 
-        csv_field = field_config.get("csv_field")
-        aggregation = field_config.get("aggregation")
-        data_clean = field_config.get("data_clean", "none")
+    Returns:
+        (sums, maxes), each of shape (n_groups, columns); an all-NaN group sums to 0 and has NaN max
+    """
+    sums = np.zeros((n_groups, values.shape[1]))
+    maxes = np.full((n_groups, values.shape[1]), np.nan)
+    for j in range(values.shape[1]):
+        column = values[:, j]
+        present = ~np.isnan(column)
+        sums[:, j] = np.bincount(codes[present], weights=column[present], minlength=n_groups)
+        np.fmax.at(maxes[:, j], codes, column)
+    return sums, maxes
+
+def build_ein_index(tax_ids):
+    """Bucket row positions by EIN with one factorize and one stable sort.
 
-        if csv_field not in ein_data.columns:
+    Returns:
+        (codes, eins, ein_to_idx): the EIN code of each row (-1 where Tax ID is
+        missing), the EINs in first-seen order, and a dict of EIN -> int32 array
+        of its row positions in input order
+    """
+    codes, eins = pd.factorize(tax_ids)
+    order = np.argsort(codes, kind="stable").astype(np.int32)
+    bounds = np.searchsorted(codes[order], np.arange(len(eins) + 1))
+    ein_to_idx = {ein: order[bounds[k]:bounds[k + 1]] for k, ein in enumerate(eins)}
+    return codes, eins, ein_to_idx
+
+def precompute_ein_aggregates(df, aggregate_plan):
+    """Compute aggregates for every EIN in a single grouped pass over the input CSV.
+
+    Rows are bucketed by build_ein_index. Numeric sums and currency maxes for
+    all fields are reduced together by _group_sum_max over the EIN codes.
+
+    Args:
+        df: Input DataFrame, with currency columns already cleaned by clean_currency_columns
+        aggregate_plan: Tuples from build_aggregate_plan
+
+    Returns:
+        DataFrame indexed by EIN with one column per included aggregate field
+    """
+    codes, eins, ein_to_idx = build_ein_index(df["Tax ID"])
+    first_rows = np.array([rows[0] for rows in ein_to_idx.values()], dtype=np.int64)
+    present = codes >= 0
+    codes = codes[present]
+    index = pd.Index(eins, name="Tax ID")
+    group_sizes = np.bincount(codes, minlength=len(index))
+
+    numeric_fields = list(dict.fromkeys(
+        csv_field
+        for _, csv_field, aggregation, data_clean in aggregate_plan
+        if csv_field in df.columns and (aggregation == "sum" or (aggregation == "max" and data_clean == "currency"))
+    ))
+    values = np.empty((len(codes), len(numeric_fields)))
+    for j, csv_field in enumerate(numeric_fields):
+        values[:, j] = pd.to_numeric(df[csv_field], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)[present]
+    sums, maxes = _group_sum_max(codes, values, len(index))
+    numeric_col = {csv_field: j for j, csv_field in enumerate(numeric_fields)}
+
+    columns = {}
+
+    for field_name, csv_field, aggregation, data_clean in aggregate_plan:
+        if csv_field not in df.columns:
             continue
 
-        column_data = ein_data[csv_field]
+        column_data = df[csv_field]
 
         if aggregation == "sum":
-            if data_clean == "currency":
-                numeric = column_data.str.replace(r"[\$,]", "", regex=True).astype(float, errors="ignore")
-                result[field_name] = numeric.sum()
-            else:
-                result[field_name] = column_data.astype(float, errors="ignore").sum()
+            columns[field_name] = pd.Series(sums[:, numeric_col[csv_field]], index=index)
 
         elif aggregation == "count":
-            result[field_name] = len(ein_data)
+            columns[field_name] = pd.Series(group_sizes, index=index)
 
         elif aggregation == "max":
             if data_clean == "currency":
-                numeric = column_data.str.replace(r"[\$,]", "", regex=True).astype(float, errors="ignore")
-                result[field_name] = numeric.max()
+                columns[field_name] = pd.Series(maxes[:, numeric_col[csv_field]], index=index)
             else:
-                result[field_name] = pd.to_datetime(column_data, errors="coerce").max()
+                dates = pd.to_datetime(column_data, errors="coerce").to_numpy()[present]
+                latest = np.full(len(index), np.iinfo(np.int64).min)
+                np.maximum.at(latest, codes, dates.view(np.int64))
+                columns[field_name] = pd.Series(latest.view(dates.dtype), index=index)
 
         elif aggregation == "first":
-            result[field_name] = column_data.iloc[0] if len(column_data) > 0 else None
+            columns[field_name] = pd.Series(column_data.to_numpy()[first_rows], index=index)
 
-    return result
+    return pd.DataFrame(columns, index=index)
+
+_RESULT_SECTIONS = ("financial_metrics", "compliance_check", "external_validation", "organization_type")
 
-def extract_field_value(result, field):
+def _find_field_path(result, field):
     if hasattr(result, field):
-        return getattr(result, field)
-    if hasattr(result, "financial_metrics") and hasattr(result.financial_metrics, field):
-        return getattr(result.financial_metrics, field)
-    if hasattr(result, "compliance_check") and hasattr(result.compliance_check, field):
-        return getattr(result.compliance_check, field)
-    if hasattr(result, "external_validation") and hasattr(result.external_validation, field):
-        return getattr(result.external_validation, field)
-    if hasattr(result, "organization_type") and hasattr(result.organization_type, field):
-        return getattr(result.organization_type, field)
+        return field
+    for section in _RESULT_SECTIONS:
+        if hasattr(getattr(result, section, None), field):
+            return f"{section}.{field}"
     return None
 
-def process_batch(eins, fields, charapi_config, input_df, aggregate_config, start_idx, total_eins):
-    rows = []
+def _search_field(result, field):
+    path = _find_field_path(result, field)
+    return None if path is None else attrgetter(path)(result)
 
-    for idx, ein in enumerate(eins, 1):
-        overall_idx = start_idx + idx
-        print(f"[{overall_idx}/{total_eins}] Evaluating {ein}...")
-        result = evaluate_charity(ein, charapi_config)
+def build_field_paths(result, fields):
+    """Resolve, once, where each field lives on a CharityEvaluationResult.
 
-        row_data = {field: extract_field_value(result, field) for field in fields}
-        aggregates = compute_ein_aggregates(input_df, ein, aggregate_config)
-        row_data.update(aggregates)
-        rows.append(row_data)
+    Args:
+        result: A sample CharityEvaluationResult
+        fields: Field names to resolve
+
+    Returns:
+        Dict of field_name -> dotted attribute path, or None if the sample lacks the field
+    """
+    return {field: _find_field_path(result, field) for field in fields}
+
+def build_field_getters(field_paths):
+    """Turn resolved field paths into one operator.attrgetter per field.
+
+    Fields the sample could not resolve get a getter that searches each result instead.
+    """
+    return {
+        field: attrgetter(path) if path else functools.partial(_search_field, field=field)
+        for field, path in field_paths.items()
+    }
+
+def extract_field_value(result, getter):
+    try:
+        return getter(result)
+    except AttributeError:
+        return None
+
+@functools.lru_cache(maxsize=None)
+def _charapi_config_hash(charapi_config):
+    """Hash the charapi config file's contents together with the installed charapi version."""
+    try:
+        charapi_version = importlib.metadata.version("charapi")
+    except importlib.metadata.PackageNotFoundError:
+        charapi_version = "unknown"
+    digest = hashlib.sha1(Path(charapi_config).read_bytes())
+    digest.update(charapi_version.encode())
+    return digest.hexdigest()[:12]
+
+def _load_cached_result(cache_file):
+    global _WARNED_BAD_CACHE
+    try:
+        with open(cache_file, "rb") as f:
+            return pickle.load(f)
+    except (EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+        if not _WARNED_BAD_CACHE:
+            _WARNED_BAD_CACHE = True
+            print(f"Warning: ignoring unreadable cache entry {cache_file} ({type(e).__name__}: {e}); re-evaluating")
+        return None
+
+@functools.lru_cache(maxsize=_EVAL_MEMO_SIZE)
+def _cached_eval(ein, charapi_config, cache_dir=None, force_refresh=False):
+    """Evaluate an EIN, reusing a cached result when cache_dir is set.
+
+    The in-memory memo is kept small: it only needs to hold the sample EIN
+    main() evaluates until its batch asks for it again. Disk entries are
+    pickled results stored under a hash of the charapi config file's contents
+    and the charapi version, so editing the config or upgrading charapi starts
+    a fresh cache. Unreadable entries are re-evaluated and rewritten.
+    force_refresh ignores existing entries but still rewrites them.
+    """
+    if cache_dir is None:
+        return evaluate_charity(ein, charapi_config)
+
+    cache_file = Path(cache_dir) / _charapi_config_hash(charapi_config) / f"{ein}.pkl"
+    if not force_refresh and cache_file.exists():
+        result = _load_cached_result(cache_file)
+        if result is not None:
+            return result
+
+    result = evaluate_charity(ein, charapi_config)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix(".tmp")
+    with open(tmp_file, "wb") as f:
+        pickle.dump(result, f)
+    os.replace(tmp_file, cache_file)
+    return result
+
+def split_ein_aggregates(ein_aggregates):
+    """Break the aggregate frame into plain per-EIN tuples so tasks carry only their own values.
+
+    Returns:
+        (columns, rows): aggregate column names, and a dict of EIN -> tuple of values in column order
+    """
+    columns = tuple(ein_aggregates.columns)
+    rows = dict(zip(ein_aggregates.index, ein_aggregates.itertuples(index=False, name=None)))
+    return columns, rows
 
-    return pd.DataFrame(rows, columns=fields)
+def _process_one_ein(ein, getters, charapi_config, aggregates, cache_dir, force_refresh):
+    result = _cached_eval(ein, charapi_config, cache_dir, force_refresh)
+    return tuple(extract_field_value(result, getter) for getter in getters) + aggregates
+
+def _csv_cell(value):
+    if value is None or value is pd.NaT or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    if isinstance(value, pd.Timestamp) and value == value.normalize():
+        return value.date().isoformat()
+    return value
+
+def process_batch(eins, field_getters, charapi_config, agg_columns, agg_rows, output_file, start_idx, total_eins, workers, cache_dir=None, force_refresh=False):
+    """Evaluate a batch of EINs and stream one CSV row per EIN to output_file as it completes.
+
+    Rows go to a temporary file that replaces output_file only once the batch is complete.
+
+    Returns:
+        Number of rows written
+    """
+    columns = tuple(field_getters) + tuple(agg_columns)
+    getters = tuple(field_getters.values())
+    missing = (None,) * len(agg_columns)
+    written = 0
+
+    tmp_file = Path(output_file).with_suffix(".csv.tmp")
+    try:
+        with open(tmp_file, "w", newline="", buffering=1 << 20) as f, ThreadPoolExecutor(max_workers=workers) as executor:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+
+            row_iter = executor.map(
+                _process_one_ein,
+                eins,
+                repeat(getters),
+                repeat(charapi_config),
+                [agg_rows.get(ein, missing) for ein in eins],
+                repeat(cache_dir),
+                repeat(force_refresh),
+            )
+            for ein, row in zip(eins, row_iter):
+                writer.writerow(map(_csv_cell, row))
+                written += 1
+                if written % _PROGRESS_INTERVAL == 0 or written == len(eins):
+                    print(f"[{start_idx + written}/{total_eins}] Evaluated through {ein}")
+                if written % _FLUSH_INTERVAL == 0:
+                    f.flush()
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+
+    os.replace(tmp_file, output_file)
+    return written
+
+def remove_stale_batches(output_dir, output_name, total_batches):
+    """Delete batch files left by an earlier run that are numbered beyond total_batches."""
+    prefix = f"{output_name}_batch_"
+    for batch_file in output_dir.glob(f"{prefix}*.csv"):
+        batch_num = batch_file.stem[len(prefix):]
+        if batch_num.isdigit() and int(batch_num) > total_batches:
+            batch_file.unlink()
 
 def main():
-    config_path = Path(__file__).parent / "config" / "config.yaml"
-    config = Box.from_yaml(filename=config_path)
+    config = load_config()
 
     print("fidcsv - Fidelity Charitable CSV Processor")
     print(f"Data file: {config.data}")
 
     output_dir = Path(config.output_dir)
-    if output_dir.exists():
-        shutil.rmtree(output_dir)
-    output_dir.mkdir(parents=True)
-    print(f"Output directory: {output_dir} (reset)")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"Output directory: {output_dir}")
 
-    df = pd.read_csv(config.data)
+    aggregate_plan = build_aggregate_plan(config.input_aggregates)
+    df = load_input(config.data, aggregate_plan)
 
     print(f"Loaded {len(df)} rows")
     print(f"Columns: {list(df.columns)}")
 
+    clean_currency_columns(df, aggregate_plan)
+    agg_columns, agg_rows = split_ein_aggregates(precompute_ein_aggregates(df, aggregate_plan))
+
     unique_eins = df["Tax ID"].dropna().unique()
     print(f"\nFound {len(unique_eins)} unique EINs")
     print(f"Sample EINs: {list(unique_eins[:5])}")
@@ -117,18 +414,28 @@ def main():
         unique_eins = unique_eins[:config.limit]
         print(f"Processing first {len(unique_eins)} EINs (limit set in config)")
 
-    included_fields = [
+    included_fields = tuple(
         field_name
         for field_name, field_config in config.fields.items()
         if field_config.include
-    ]
+    )
 
     print(f"\nOutput will have {len(included_fields)} columns")
     print(f"Sample columns: {list(included_fields[:5])}...")
 
+    install_shared_session(max(32, config.workers))
+    cache_dir = str(config.cache_dir) if config.cache_dir else None
+
+    field_paths = dict.fromkeys(included_fields)
+    if len(unique_eins) > 0:
+        sample = _cached_eval(unique_eins[0], config.charapi_config_path, cache_dir, config.force_refresh)
+        field_paths = build_field_paths(sample, included_fields)
+    field_getters = build_field_getters(field_paths)
+
     if config.batch > 0:
         total_batches = (len(unique_eins) + config.batch - 1) // config.batch
         print(f"\nProcessing {len(unique_eins)} EINs in {total_batches} batches of {config.batch}")
+        remove_stale_batches(output_dir, config.output, total_batches)
 
         for batch_num in range(total_batches):
             start = batch_num * config.batch
@@ -136,17 +443,15 @@ def main():
             batch_eins = unique_eins[start:end]
 
             print(f"\n=== Batch {batch_num + 1}/{total_batches} ===")
-            batch_df = process_batch(batch_eins, included_fields, config.charapi_config_path, df, config.input_aggregates, start, len(unique_eins))
-
             output_filename = f"{config.output}_batch_{batch_num + 1}.csv"
             output_file = output_dir / output_filename
-            batch_df.to_csv(output_file, index=False)
+            process_batch(batch_eins, field_getters, config.charapi_config_path, agg_columns, agg_rows, output_file, start, len(unique_eins), config.workers, cache_dir, config.force_refresh)
             print(f"Batch {batch_num + 1} written to {output_file}")
     else:
         print(f"\nEvaluating {len(unique_eins)} charities (no batching)...")
-        output_df = process_batch(unique_eins, included_fields, config.charapi_config_path, df, config.input_aggregates, 0, len(unique_eins))
+        remove_stale_batches(output_dir, config.output, 0)
         output_file = output_dir / f"{config.output}.csv"
-        output_df.to_csv(output_file, index=False)
+        process_batch(unique_eins, field_getters, config.charapi_config_path, agg_columns, agg_rows, output_file, 0, len(unique_eins), config.workers, cache_dir, config.force_refresh)
         print(f"\nOutput written to {output_file}")
 
 def sanity_check(output_dir, output_name):
@@ -156,11 +461,18 @@ def sanity_check(output_dir, output_name):
         print("No batch files found for sanity check")
         return
 
-    all_data = pd.concat([pd.read_csv(f) for f in batch_files], ignore_index=True)
+    seen_eins = set()
+    total_donated = 0.0
+    total_rows = 0
+    sector_counts = Counter()
+    for f in batch_files:
+        for chunk in pd.read_csv(f, usecols=["ein", "total_donated", "charitable_sector"], chunksize=50_000):
+            seen_eins.update(chunk["ein"].dropna())
+            total_donated += chunk["total_donated"].sum()
+            sector_counts.update(chunk["charitable_sector"].dropna())
+            total_rows += len(chunk)
 
-    distinct_charities = all_data["ein"].nunique()
-    total_donated = all_data["total_donated"].sum()
-    cause_dist = all_data["charitable_sector"].value_counts().sort_values(ascending=False)
+    distinct_charities = len(seen_eins)
 
     print("\n" + "="*70)
     print("SANITY CHECK REPORT")
@@ -169,15 +481,12 @@ def sanity_check(output_dir, output_name):
     print(f"Total donated across all charities: ${total_donated:,.2f}")
     print("\nDistribution of charitable sectors:")
     print("-" * 70)
-    for sector, count in cause_dist.items():
-        pct = (count / len(all_data)) * 100
+    for sector, count in sector_counts.most_common():
+        pct = (count / total_rows) * 100
         print(f"  {sector:40s} {count:3d} charities ({pct:5.1f}%)")
     print("="*70)
 
 if __name__ == "__main__":
     main()
-
-    config_path = Path(__file__).parent / "config" / "config.yaml"
-    config = Box.from_yaml(filename=config_path)
-    output_dir = Path(config.output_dir)
-    sanity_check(output_dir, config.output)
+    config = load_config()
+    sanity_check(Path(config.output_dir), config.output)
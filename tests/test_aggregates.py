@@ -0,0 +1,118 @@
+import pytest
+import numpy as np
+import pandas as pd
+from box import Box
+import fidcsv.main as fidcsv_main
+from fidcsv.main import _group_sum_max, build_aggregate_plan, build_ein_index, load_input, clean_currency_columns, precompute_ein_aggregates, split_ein_aggregates
+
+AGGREGATE_CONFIG = Box({
+    "total_donated": {"include": True, "csv_field": "Amount", "aggregation": "sum", "data_clean": "currency"},
+    "donation_count": {"include": True, "csv_field": "Tax ID", "aggregation": "count"},
+    "most_recent_donation_date": {"include": True, "csv_field": "Approved Date", "aggregation": "max"},
+    "charitable_sector": {"include": True, "csv_field": "Charitable Sector", "aggregation": "first"},
+    "largest_gift": {"include": False, "csv_field": "Amount", "aggregation": "max", "data_clean": "currency"},
+})
+AGGREGATE_PLAN = build_aggregate_plan(AGGREGATE_CONFIG)
+
+def make_raw_input_df():
+    return pd.DataFrame({
+        "Tax ID": ["11-1111111", "22-2222222", "11-1111111"],
+        "Amount": ["$1,000.00", "$50.00", "$250.50"],
+        "Approved Date": ["01/15/2024", "03/01/2024", "06/30/2024"],
+        "Charitable Sector": ["Education", "Health", "Education"],
+    })
+
+def make_input_df():
+    return clean_currency_columns(make_raw_input_df(), AGGREGATE_PLAN)
+
+def test_unknown_aggregation_rejected():
+    config = Box({"median_gift": {"include": True, "csv_field": "Amount", "aggregation": "median"}})
+    with pytest.raises(ValueError, match="median_gift"):
+        build_aggregate_plan(config)
+
+def test_currency_columns_cleaned_to_float():
+    df = make_input_df()
+    assert df["Amount"].dtype == "float64"
+    assert df["Amount"].tolist() == [1000.0, 50.0, 250.5]
+
+def test_unparseable_currency_becomes_nan():
+    df = make_raw_input_df()
+    df.loc[1, "Amount"] = "n/a"
+    clean_currency_columns(df, AGGREGATE_PLAN)
+    assert df["Amount"].isna().tolist() == [False, True, False]
+
+def test_aggregates_per_ein():
+    ein_aggregates = precompute_ein_aggregates(make_input_df(), AGGREGATE_PLAN)
+    aggregates = ein_aggregates.loc["11-1111111"]
+
+    assert aggregates["total_donated"] == pytest.approx(1250.50)
+    assert aggregates["donation_count"] == 2
+    assert aggregates["most_recent_donation_date"] == pd.Timestamp("2024-06-30")
+    assert aggregates["charitable_sector"] == "Education"
+
+def test_excluded_aggregates_are_skipped():
+    assert [field_name for field_name, _, _, _ in AGGREGATE_PLAN] == [
+        "total_donated", "donation_count", "most_recent_donation_date", "charitable_sector"
+    ]
+    ein_aggregates = precompute_ein_aggregates(make_input_df(), AGGREGATE_PLAN)
+    assert "largest_gift" not in ein_aggregates.columns
+
+def test_one_row_per_ein():
+    ein_aggregates = precompute_ein_aggregates(make_input_df(), AGGREGATE_PLAN)
+    assert list(ein_aggregates.index) == ["11-1111111", "22-2222222"]
+
+def test_load_input_keeps_aggregate_columns(tmp_path):
+    data_file = tmp_path / "data.csv"
+    input_df = make_raw_input_df()
+    input_df["Memo"] = ["a", "b", "c"]
+    input_df.to_csv(data_file, index=False)
+
+    df = load_input(data_file, AGGREGATE_PLAN)
+
+    assert set(df.columns) == {"Tax ID", "Amount", "Approved Date", "Charitable Sector"}
+    assert isinstance(df["Tax ID"].dtype, pd.CategoricalDtype)
+
+def test_group_sum_max_skips_nan():
+    codes = np.array([0, 1, 0, 1])
+    values = np.array([[1.0, 5.0], [np.nan, 2.0], [3.0, np.nan], [np.nan, 4.0]])
+
+    sums, maxes = _group_sum_max(codes, values, 2)
+
+    assert sums.tolist() == [[4.0, 5.0], [0.0, 6.0]]
+    assert maxes[0].tolist() == [3.0, 5.0]
+    assert np.isnan(maxes[1, 0]) and maxes[1, 1] == 4.0
+
+def test_ein_index_buckets_rows():
+    tax_ids = pd.Series(["11-1111111", None, "22-2222222", "11-1111111"])
+
+    codes, eins, ein_to_idx = build_ein_index(tax_ids)
+
+    assert codes.tolist() == [0, -1, 1, 0]
+    assert list(eins) == ["11-1111111", "22-2222222"]
+    assert ein_to_idx["11-1111111"].tolist() == [0, 3]
+    assert ein_to_idx["22-2222222"].tolist() == [2]
+
+def test_split_ein_aggregates_into_tuples():
+    columns, rows = split_ein_aggregates(precompute_ein_aggregates(make_input_df(), AGGREGATE_PLAN))
+
+    assert columns == ("total_donated", "donation_count", "most_recent_donation_date", "charitable_sector")
+    assert rows["22-2222222"] == (50.0, 1, pd.Timestamp("2024-03-01"), "Health")
+
+@pytest.mark.parametrize("reader", ["pyarrow", "c"])
+def test_load_input_keeps_zero_padded_eins(tmp_path, monkeypatch, reader):
+    if reader == "pyarrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(fidcsv_main, "pa_csv", None)
+    data_file = tmp_path / "data.csv"
+    data_file.write_text(
+        "Tax ID,Amount,Approved Date,Charitable Sector\n"
+        "123456789,$10.00,01/15/2024,Education\n"
+        "012345678,$5.00,02/15/2024,\n"
+    )
+
+    df = load_input(data_file, AGGREGATE_PLAN)
+
+    assert sorted(df["Tax ID"].cat.categories) == ["012345678", "123456789"]
+    assert df["Amount"].tolist() == ["$10.00", "$5.00"]
+    assert df["Charitable Sector"].isna().tolist() == [False, True]
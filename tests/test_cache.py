@@ -0,0 +1,104 @@
+import pickle
+from pathlib import Path
+import pytest
+import fidcsv.main as fidcsv_main
+from fidcsv.main import _cached_eval, _charapi_config_hash
+
+@pytest.fixture
+def eval_calls(monkeypatch):
+    calls = []
+
+    def fake_evaluate_charity(ein, charapi_config):
+        calls.append((ein, str(charapi_config)))
+        return {"ein": ein, "call": len(calls)}
+
+    monkeypatch.setattr(fidcsv_main, "evaluate_charity", fake_evaluate_charity)
+    monkeypatch.setattr(fidcsv_main, "_WARNED_BAD_CACHE", False)
+    _cached_eval.cache_clear()
+    _charapi_config_hash.cache_clear()
+    yield calls
+    _cached_eval.cache_clear()
+    _charapi_config_hash.cache_clear()
+
+@pytest.fixture
+def charapi_config(tmp_path):
+    config_file = tmp_path / "charapi.yaml"
+    config_file.write_text("scoring: default\n")
+    return str(config_file)
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "cache")
+
+def cache_entries(cache_dir):
+    return sorted(p.relative_to(cache_dir).as_posix() for p in Path(cache_dir).glob("*/*.pkl"))
+
+def test_result_read_back_from_disk(eval_calls, charapi_config, cache_dir):
+    first = _cached_eval("11-1111111", charapi_config, cache_dir)
+    _cached_eval.cache_clear()
+    second = _cached_eval("11-1111111", charapi_config, cache_dir)
+
+    assert len(eval_calls) == 1
+    assert second == first
+    assert len(cache_entries(cache_dir)) == 1
+
+def test_force_refresh_overwrites_disk_entry(eval_calls, charapi_config, cache_dir):
+    _cached_eval("11-1111111", charapi_config, cache_dir)
+    refreshed = _cached_eval("11-1111111", charapi_config, cache_dir, True)
+    _cached_eval.cache_clear()
+    reread = _cached_eval("11-1111111", charapi_config, cache_dir)
+
+    assert len(eval_calls) == 2
+    assert refreshed["call"] == 2
+    assert reread == refreshed
+
+def test_cache_is_separate_per_charapi_config(eval_calls, charapi_config, cache_dir, tmp_path):
+    other_config = tmp_path / "other.yaml"
+    other_config.write_text("scoring: strict\n")
+
+    _cached_eval("11-1111111", charapi_config, cache_dir)
+    _cached_eval("11-1111111", str(other_config), cache_dir)
+
+    assert eval_calls == [("11-1111111", charapi_config), ("11-1111111", str(other_config))]
+    assert len({entry.split("/")[0] for entry in cache_entries(cache_dir)}) == 2
+
+def test_editing_charapi_config_invalidates_cache(eval_calls, charapi_config, cache_dir):
+    _cached_eval("11-1111111", charapi_config, cache_dir)
+    with open(charapi_config, "w") as f:
+        f.write("scoring: strict\n")
+    _cached_eval.cache_clear()
+    _charapi_config_hash.cache_clear()
+
+    _cached_eval("11-1111111", charapi_config, cache_dir)
+
+    assert len(eval_calls) == 2
+    assert len(cache_entries(cache_dir)) == 2
+
+def test_charapi_version_is_part_of_hash(eval_calls, charapi_config, monkeypatch):
+    before = _charapi_config_hash(charapi_config)
+    _charapi_config_hash.cache_clear()
+    monkeypatch.setattr(fidcsv_main.importlib.metadata, "version", lambda name: "99.0.0")
+
+    assert _charapi_config_hash(charapi_config) != before
+
+def test_unreadable_entry_is_reevaluated(eval_calls, charapi_config, cache_dir, capsys):
+    _cached_eval("11-1111111", charapi_config, cache_dir)
+    entry = Path(cache_dir) / cache_entries(cache_dir)[0]
+    entry.write_bytes(pickle.dumps({"ein": "11-1111111"})[:5])
+    _cached_eval.cache_clear()
+
+    result = _cached_eval("11-1111111", charapi_config, cache_dir)
+
+    assert result["call"] == 2
+    assert "unreadable cache entry" in capsys.readouterr().out
+    with open(entry, "rb") as f:
+        assert pickle.load(f) == result
+
+def test_memo_without_cache_dir(eval_calls, charapi_config):
+    _cached_eval("11-1111111", charapi_config)
+    _cached_eval("11-1111111", charapi_config)
+
+    assert len(eval_calls) == 1
+
+def test_memo_is_bounded():
+    assert _cached_eval.cache_info().maxsize == fidcsv_main._EVAL_MEMO_SIZE
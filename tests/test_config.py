@@ -1,10 +1,8 @@
 import pytest
-from pathlib import Path
-from box import Box
+from fidcsv.main import load_config
 
 def test_config_loads():
-    config_path = Path(__file__).parent.parent / "fidcsv" / "config" / "config.yaml"
-    config = Box.from_yaml(filename=config_path)
+    config = load_config()
 
     assert config.data is not None
     assert config.output is not None
@@ -12,16 +10,14 @@ def test_config_loads():
     assert config.fields is not None
 
 def test_config_has_required_fields():
-    config_path = Path(__file__).parent.parent / "fidcsv" / "config" / "config.yaml"
-    config = Box.from_yaml(filename=config_path)
+    config = load_config()
 
     assert "ein" in config.fields
     assert "organization_name" in config.fields
     assert "mission" in config.fields
 
 def test_all_fields_have_include():
-    config_path = Path(__file__).parent.parent / "fidcsv" / "config" / "config.yaml"
-    config = Box.from_yaml(filename=config_path)
+    config = load_config()
 
     for field_name, field_config in config.fields.items():
         assert hasattr(field_config, "include")
@@ -1,6 +1,4 @@
 import pytest
-from pathlib import Path
-from box import Box
 from charapi.data.charity_evaluation_result import (
     CharityEvaluationResult,
     FinancialMetrics,
@@ -8,10 +6,10 @@ from charapi.data.charity_evaluation_result import (
     ExternalValidation,
     OrganizationType
 )
+from fidcsv.main import load_config, build_field_paths, build_field_getters, extract_field_value
 
 def get_included_fields():
-    config_path = Path(__file__).parent.parent / "fidcsv" / "config" / "config.yaml"
-    config = Box.from_yaml(filename=config_path)
+    config = load_config()
     return [
         field_name
         for field_name, field_config in config.fields.items()
@@ -22,7 +20,7 @@ def test_included_fields_not_empty():
     fields = get_included_fields()
     assert len(fields) > 0
 
-def test_field_extraction_from_result():
+def make_result():
     financial_metrics = FinancialMetrics(
         program_expense_ratio=0.75,
         admin_expense_ratio=0.15,
@@ -80,6 +78,10 @@ def test_field_extraction_from_result():
         total_metrics=9,
         summary="Test summary"
     )
+    return result
+
+def test_field_extraction_from_result():
+    result = make_result()
 
     assert hasattr(result, "ein")
     assert result.ein == "12-3456789"
@@ -87,3 +89,28 @@ def test_field_extraction_from_result():
     assert result.financial_metrics.program_expense_ratio == 0.75
     assert hasattr(result.compliance_check, "in_pub78")
     assert result.compliance_check.in_pub78 is True
+
+def test_field_paths_resolve_nested_fields():
+    field_paths = build_field_paths(make_result(), ["ein", "program_expense_ratio", "in_pub78", "years_operating", "no_such_field"])
+
+    assert field_paths["ein"] == "ein"
+    assert field_paths["program_expense_ratio"] == "financial_metrics.program_expense_ratio"
+    assert field_paths["in_pub78"] == "compliance_check.in_pub78"
+    assert field_paths["years_operating"] == "organization_type.years_operating"
+    assert field_paths["no_such_field"] is None
+
+def test_extract_field_value_uses_field_getters():
+    result = make_result()
+    field_getters = build_field_getters(build_field_paths(result, get_included_fields() + ["no_such_field"]))
+
+    assert extract_field_value(result, field_getters["ein"]) == "12-3456789"
+    assert extract_field_value(result, field_getters["program_expense_ratio"]) == 0.75
+    assert extract_field_value(result, field_getters["charity_navigator_rating"]) == 4
+    assert extract_field_value(result, field_getters["no_such_field"]) is None
+
+def test_extract_field_value_from_missing_section():
+    field_getters = build_field_getters(build_field_paths(make_result(), ["program_expense_ratio"]))
+    result = make_result()
+    result.financial_metrics = None
+
+    assert extract_field_value(result, field_getters["program_expense_ratio"]) is None
@@ -0,0 +1,121 @@
+import csv
+import time
+from types import SimpleNamespace
+import pandas as pd
+import pytest
+import fidcsv.main as fidcsv_main
+from fidcsv.main import _cached_eval, build_field_paths, build_field_getters, process_batch, remove_stale_batches, sanity_check
+
+EINS = [f"{n:02d}-0000000" for n in range(12)]
+
+def fake_result(ein):
+    return SimpleNamespace(
+        ein=ein,
+        score=None if ein == EINS[1] else 80.0,
+        financial_metrics=SimpleNamespace(net_assets=float("nan") if ein == EINS[2] else 1000),
+    )
+
+@pytest.fixture
+def fake_evaluator(monkeypatch):
+    def fake_evaluate_charity(ein, charapi_config):
+        # Earlier EINs sleep longer, so each wave of workers finishes in reverse order
+        time.sleep(0.005 * (len(EINS) - EINS.index(ein)))
+        return fake_result(ein)
+
+    monkeypatch.setattr(fidcsv_main, "evaluate_charity", fake_evaluate_charity)
+    _cached_eval.cache_clear()
+    yield
+    _cached_eval.cache_clear()
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+def test_process_batch_writes_rows_in_input_order(fake_evaluator, tmp_path):
+    field_getters = build_field_getters(build_field_paths(fake_result("x"), ["ein", "score", "net_assets"]))
+    agg_columns = ("total_donated", "most_recent_donation_date")
+    agg_rows = {ein: (10.5, pd.Timestamp("2024-06-30")) for ein in EINS}
+    agg_rows[EINS[3]] = (float("nan"), pd.NaT)
+    agg_rows[EINS[6]] = (1.0, pd.Timestamp("2024-06-30 14:30:00"))
+    del agg_rows[EINS[4]]
+    output_file = tmp_path / "batch.csv"
+
+    written = process_batch(EINS, field_getters, "charapi.yaml", agg_columns, agg_rows, output_file, 0, len(EINS), 4)
+
+    rows = read_rows(output_file)
+    assert written == len(EINS)
+    assert rows[0] == ["ein", "score", "net_assets", "total_donated", "most_recent_donation_date"]
+    assert [row[0] for row in rows[1:]] == EINS
+    assert rows[1] == [EINS[0], "80.0", "1000", "10.5", "2024-06-30"]
+    assert rows[2][1] == ""
+    assert rows[3][2] == ""
+    assert rows[4][3:] == ["", ""]
+    assert rows[5][3:] == ["", ""]
+    assert rows[7][4] == "2024-06-30 14:30:00"
+    assert list(tmp_path.iterdir()) == [output_file]
+
+def test_sanity_check_matches_concatenated_batches(tmp_path, capsys):
+    batches = [
+        pd.DataFrame({
+            "ein": ["11-1111111", "22-2222222", "33-3333333"],
+            "score": [1, 2, 3],
+            "total_donated": [100.0, 250.5, None],
+            "charitable_sector": ["Education", "Health", None],
+        }),
+        pd.DataFrame({
+            "ein": ["44-4444444", "11-1111111"],
+            "score": [4, 5],
+            "total_donated": [49.5, 10.0],
+            "charitable_sector": ["Education", "Education"],
+        }),
+    ]
+    for batch_num, batch in enumerate(batches, 1):
+        batch.to_csv(tmp_path / f"out_batch_{batch_num}.csv", index=False)
+
+    sanity_check(tmp_path, "out")
+
+    all_data = pd.concat(batches, ignore_index=True)
+    report = capsys.readouterr().out
+    assert f"Distinct charities evaluated: {all_data['ein'].nunique()}" in report
+    assert f"Total donated across all charities: ${all_data['total_donated'].sum():,.2f}" in report
+    for sector, count in all_data["charitable_sector"].value_counts().items():
+        pct = (count / len(all_data)) * 100
+        assert f"  {sector:40s} {count:3d} charities ({pct:5.1f}%)" in report
+    assert "Education                                  3 charities ( 60.0%)" in report
+    assert "Health                                     1 charities ( 20.0%)" in report
+
+def test_failed_batch_leaves_no_temp_file(monkeypatch, tmp_path):
+    def failing_evaluate_charity(ein, charapi_config):
+        if ein == EINS[5]:
+            raise RuntimeError("charapi unavailable")
+        return fake_result(ein)
+
+    monkeypatch.setattr(fidcsv_main, "evaluate_charity", failing_evaluate_charity)
+    _cached_eval.cache_clear()
+    field_getters = build_field_getters(build_field_paths(fake_result("x"), ["ein"]))
+
+    with pytest.raises(RuntimeError):
+        process_batch(EINS, field_getters, "charapi.yaml", (), {}, tmp_path / "batch.csv", 0, len(EINS), 4)
+
+    _cached_eval.cache_clear()
+    assert list(tmp_path.iterdir()) == []
+
+def make_output_files(output_dir, names):
+    for name in names:
+        (output_dir / name).write_text("ein\n")
+
+def test_remove_stale_batches_beyond_total(tmp_path):
+    make_output_files(tmp_path, ["out_batch_1.csv", "out_batch_2.csv", "out_batch_3.csv", "out.csv", "other_batch_3.csv", "out_batch_notes.csv"])
+
+    remove_stale_batches(tmp_path, "out", 2)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "other_batch_3.csv", "out.csv", "out_batch_1.csv", "out_batch_2.csv", "out_batch_notes.csv"
+    ]
+
+def test_remove_stale_batches_without_batching(tmp_path):
+    make_output_files(tmp_path, ["out_batch_1.csv", "out_batch_2.csv", "out.csv", "other_batch_1.csv"])
+
+    remove_stale_batches(tmp_path, "out", 0)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["other_batch_1.csv", "out.csv"]
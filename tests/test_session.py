@@ -0,0 +1,25 @@
+import requests
+import pytest
+import fidcsv.main as fidcsv_main
+from fidcsv.main import install_shared_session
+
+@pytest.fixture
+def restore_requests(monkeypatch):
+    monkeypatch.setattr(requests, "get", requests.get)
+    monkeypatch.setattr(requests, "post", requests.post)
+    monkeypatch.setattr(fidcsv_main, "_SESSION", None)
+
+def test_shared_session_routes_requests(restore_requests):
+    session = install_shared_session(16)
+
+    assert requests.get.__self__ is session
+    assert requests.post.__self__ is session
+    assert session.get_adapter("https://example.org")._pool_maxsize == 16
+
+def test_shared_session_installed_once(restore_requests):
+    session = install_shared_session(16)
+    patched_get = requests.get
+
+    assert install_shared_session(64) is session
+    assert requests.get is patched_get
+    assert session.get_adapter("https://example.org")._pool_maxsize == 16